@@ -1,7 +1,8 @@
 import os
+import io
 import json
+import mmap
 import argparse
-import mailbox
 import email.utils
 import openpyxl
 import re
@@ -9,18 +10,102 @@ import re
 from tqdm import tqdm
 from bs4 import BeautifulSoup
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from operator import itemgetter
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, KeepTogether
+from xml.sax.saxutils import escape
 from reportlab.lib.units import inch
 from dotenv import load_dotenv
 from ics import Calendar
 from email import policy
+from email.parser import BytesParser
 from email.utils import parseaddr
 from email.utils import parsedate_tz, mktime_tz
 from datetime import datetime
 
+# orjson is a C JSON parser that is several times faster than the stdlib on
+# large files; fall back to stdlib json if it isn't installed.
+try:
+    import orjson
+
+    def json_loads(data):
+        return orjson.loads(data)
+except ImportError:
+    def json_loads(data):
+        return json.loads(data)
+
+# ijson streams the messages array instead of materializing the whole
+# document, keeping memory flat for very large chats. Its default backend
+# selection already prefers the C (yajl2_c) implementation when present.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# selectolax wraps the lexbor C HTML engine and is far faster than
+# BeautifulSoup's pure-Python html.parser; use it when available.
+try:
+    from selectolax.parser import HTMLParser as SelectolaxHTMLParser
+except ImportError:
+    SelectolaxHTMLParser = None
+
+# When selectolax is missing, at least back BeautifulSoup with lxml's C
+# parser rather than the pure-Python html.parser if we can.
+try:
+    import lxml  # noqa: F401
+    BS4_PARSER = "lxml"
+except ImportError:
+    BS4_PARSER = "html.parser"
+
+# pypdf lets the threaded PDF be assembled one thread at a time instead of
+# holding every flowable for the whole mailbox before a single build.
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
+# xlsxwriter's constant_memory mode streams rows straight to disk instead of
+# building openpyxl's per-cell object model for the whole sheet.
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+
+def iter_messages(messages_path):
+    """Yield the messages from a messages.json file one at a time.
+
+    Streams the 'messages' array with ijson so memory use is independent of
+    chat size; falls back to parsing the whole file when ijson is unavailable.
+    """
+    if ijson is not None:
+        with open(messages_path, "rb") as file:
+            yield from ijson.items(file, "messages.item")
+    else:
+        with open(messages_path, "rb") as file:
+            raw = file.read()
+
+        # Decode just the top-level "messages" array where possible, so
+        # sibling metadata in the file is never materialized; any anomaly
+        # falls back to a full parse.
+        messages = None
+        key_index = raw.find(b'"messages"')
+        if key_index != -1:
+            array_start = raw.find(b"[", key_index)
+            if array_start != -1:
+                try:
+                    messages, _ = json.JSONDecoder().raw_decode(raw[array_start:].decode("utf-8"))
+                except (UnicodeDecodeError, ValueError):
+                    messages = None
+        if not isinstance(messages, list):
+            messages = json_loads(raw).get("messages", [])
+
+        yield from messages
+
+
 # Load environment variables from the .env file
 load_dotenv()
 
@@ -28,23 +113,121 @@ OUTPUT_ICS_ATTACHMENTS = os.getenv("OUTPUT_ICS_ATTACHMENTS", "false").strip().lo
 
 def get_arg_or_env(arg_name, env_name, required=False):
     """Helper function to get argument from command line or from environment variable."""
-    # Check for command-line argument first
-    if args.__dict__.get(arg_name):
-        return getattr(args, arg_name)
-    
-    # If not found in command line, check environment variables
-    env_value = os.getenv(env_name)
-    if env_value:
-        return env_value
-    
+    # Command-line argument wins, then the environment variable
+    value = getattr(args, arg_name, None) or os.environ.get(env_name)
+    if value:
+        return value
+
     # If neither command line nor environment variable is found and required, show error
     if required:
         parser.print_help()
         raise ValueError(f"Error: '{arg_name}' is required, but not provided.")
-    
+
     # If it's not required, return None instead of raising an error
     return None
 
+# Sentinel for messages without a creator, shared across the hot loop
+_UNKNOWN_CREATOR = {"name": "Unknown"}
+
+# Characters not allowed in transcript filenames
+_SAFE_NAME_RE = re.compile(r'[^\w\-. ]')
+
+def _safe_name(name):
+    """Make a chat name safe to use as a filename."""
+    return _SAFE_NAME_RE.sub("_", name)[:120]
+
+
+def _create_transcript_file(transcripts_dir, file_name):
+    """Atomically create a uniquely named transcript file for a chat.
+
+    Identically named chats must not overwrite each other, and chat folders
+    are processed across worker processes, so uniqueness is enforced at the
+    filesystem: O_CREAT|O_EXCL creation either wins the name outright or
+    fails, and the loser retries with the next numeric suffix.
+    """
+    suffix = 0
+    while True:
+        candidate = file_name if suffix == 0 else f"{file_name}_{suffix}"
+        path = os.path.join(transcripts_dir, f"{candidate}.txt")
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            suffix += 1
+        else:
+            return os.fdopen(fd, "w", encoding="utf-8", buffering=1 << 20)
+
+# Match the common '"Name" <addr@host>' and bare 'addr@host' header shapes so
+# the pure-Python parseaddr state machine only runs on unusual headers
+_NAME_ADDR_RE = re.compile(r'\s*"?([^"<]*?)"?\s*<([^<>\s]+@[^<>\s]+)>\s*$')
+_BARE_ADDR_RE = re.compile(r'\s*([^<>\s"]+@[^<>\s"]+)\s*$')
+
+
+def iter_mbox_messages(mbox_path):
+    """Yield (start, end, raw_bytes) for each message in an mbox file.
+
+    Scans for the 'From ' delimiter lines and yields each message's byte
+    span plus its payload (without the delimiter line), so memory stays
+    bounded by a single message rather than the whole mailbox index.
+    """
+    with open(mbox_path, "rb") as mbox_file:
+        start = 0
+        pos = 0
+        chunks = []
+        for line in mbox_file:
+            if line.startswith(b"From "):
+                if chunks:
+                    yield start, pos, b"".join(chunks)
+                    chunks = []
+                start = pos
+            else:
+                chunks.append(line)
+            pos += len(line)
+        if chunks:
+            yield start, pos, b"".join(chunks)
+
+
+def count_mbox_messages(mbox_path):
+    """Count the messages in an mbox file with one pass over an mmap.
+
+    bytes.count runs in libc (SIMD memchr/memmem), so even multi-GB files
+    are counted in seconds without building a table of contents.
+    """
+    with open(mbox_path, "rb") as mbox_file:
+        if os.fstat(mbox_file.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(mbox_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # mmap objects expose find but not count, so step through the
+            # matches; each find call is a C-level memmem scan
+            count = 1 if mm[:5] == b"From " else 0
+            pos = mm.find(b"\nFrom ")
+            while pos != -1:
+                count += 1
+                pos = mm.find(b"\nFrom ", pos + 1)
+            return count
+
+
+def read_mbox_message(mbox_file, start, end, parse_policy=policy.compat32):
+    """Re-read and parse the message stored at [start, end) in an open mbox."""
+    mbox_file.seek(start)
+    raw = mbox_file.read(end - start)
+    # Drop the leading 'From ' delimiter line
+    if raw.startswith(b"From "):
+        raw = raw[raw.find(b"\n") + 1:]
+    return email.message_from_bytes(raw, policy=parse_policy)
+
+
+def fast_parseaddr(address):
+    """Like email.utils.parseaddr but with a compiled-regex fast path."""
+    address = address or ""
+    match = _NAME_ADDR_RE.match(address)
+    if match:
+        return match.group(1).strip(), match.group(2)
+    match = _BARE_ADDR_RE.match(address)
+    if match:
+        return "", match.group(1)
+    return email.utils.parseaddr(address)
+
+
 def process_chat_folder(chat_folder, output_folder):
     """
     Process a single chat folder and generate a formatted text file.
@@ -56,17 +239,20 @@ def process_chat_folder(chat_folder, output_folder):
     The function reads the `group_info.json` and `messages.json` files, formats the data, 
     and writes the conversation into a text file in the output folder.
     """
-    group_info_path = os.path.join(chat_folder, "group_info.json")
-    messages_path = os.path.join(chat_folder, "messages.json")
+    # One directory scan covers both existence checks and the attachment list,
+    # instead of separate os.path.exists and os.listdir calls; the DirEntry
+    # objects carry ready-made paths for the JSON reads
+    with os.scandir(chat_folder) as it:
+        entries = {entry.name: entry for entry in it}
 
     # Ensure group_info.json exists
-    if not os.path.exists(group_info_path):
+    if "group_info.json" not in entries:
         print(f"Skipping {chat_folder}: group_info.json not found.")
         return
-    
-    # Read group_info.json
-    with open(group_info_path, "r", encoding="utf-8") as file:
-        group_info = json.load(file)
+
+    # Read group_info.json (binary mode: orjson parses bytes directly)
+    with open(entries["group_info.json"].path, "rb") as file:
+        group_info = json_loads(file.read())
 
     # Determine chat name
     chat_name = None
@@ -81,104 +267,126 @@ def process_chat_folder(chat_folder, output_folder):
         # Group chat (use group name)
         chat_name = group_info.get("name", folder_name)
 
-        # If the name is "Group Chat", append member initials
+        # If the name is "Group Chat", append member initials in one pass
+        # (no intermediate per-member lists)
         if chat_name == "Group Chat":
-            member_initials = [
-                "".join([part[0] for part in member["name"].split() if part])  # Extract initials
-                for member in group_info.get("members", [])
-            ]
-            chat_name += " " + "".join(member_initials)  # Append initials to the name
+            chat_name += " " + "".join(
+                part[0]
+                for member in group_info.get("members", ())
+                for part in member["name"].split()
+                if part
+            )
 
     if not chat_name:
         chat_name = folder_name  # Fallback to folder name if needed
 
-    # Ensure transcripts directory exists
-    transcripts_dir = os.path.join(output_folder, "transcripts")
-    os.makedirs(transcripts_dir, exist_ok=True)  # Create if it doesn't exist
-
-    # Set output path inside transcripts folder
-    output_path = os.path.join(transcripts_dir, f"{chat_name}.txt")
-
-
     # Read messages.json
-    if not os.path.exists(messages_path):
+    if "messages.json" not in entries:
         print(f"Skipping {chat_name}: messages.json not found.")
         return
+    messages_path = entries["messages.json"].path
 
-    with open(messages_path, "r", encoding="utf-8") as file:
-        messages_data = json.load(file)
+    # Output goes inside the transcripts folder (created once by the caller),
+    # under the sanitized chat name deduplicated atomically across workers
+    transcripts_dir = os.path.join(output_folder, "transcripts")
+    file_name = _safe_name(chat_name)
 
-    messages = messages_data.get("messages", [])
-    
     # Collect list of attachments
-    attachments = [f for f in os.listdir(chat_folder) if f not in ("group_info.json", "messages.json")]
-
-    # Write conversation to text file
-    with open(output_path, "w", encoding="utf-8") as out_file:
-        out_file.write(f"Chat: {chat_name}\n")
-        out_file.write(f"Participants: {', '.join(member.get('name',member.get('email','')) for member in group_info.get('members', []))}\n")
-        out_file.write(f"Messages: {len(messages)}\n")
-        out_file.write(f"Attachments: {len(attachments)}\n")
-        out_file.write(f"Message Path: {messages_path}\n")
-        out_file.write("=" * 40 + "\n\n")
-
-        for msg in messages:
-            creator = msg["creator"]["name"] if "creator" in msg else "Unknown"
-            timestamp = msg["created_date"] if "created_date" in msg else "Unknown time"
+    attachments = [f for f in entries if f not in ("group_info.json", "messages.json")]
+
+    # Write conversation to text file, streaming messages one at a time so
+    # huge chats never have to fit in memory. The message count is only known
+    # once the stream is exhausted, so it is written after the messages.
+    with _create_transcript_file(transcripts_dir, file_name) as out_file:
+        # Batch the formatted lines and write them in large joined chunks,
+        # rather than crossing into the I/O layer once per message
+        parts = [
+            f"Chat: {chat_name}\n",
+            f"Participants: {', '.join(member.get('name',member.get('email','')) for member in group_info.get('members', []))}\n",
+            f"Attachments: {len(attachments)}\n",
+            f"Message Path: {messages_path}\n",
+            "=" * 40 + "\n\n",
+        ]
+
+        # parts.clear() keeps the list's identity, so this stays valid
+        # across flushes
+        append_part = parts.append
+
+        message_count = 0
+        for msg in iter_messages(messages_path):
+            message_count += 1
+            # Fetch each field once and branch on locals, instead of
+            # re-hashing the same keys across the if/elif chain
+            msg_get = msg.get
+            creator = msg_get("creator", _UNKNOWN_CREATOR)["name"]
+            timestamp = msg_get("created_date", "Unknown time")
+            text_value = msg_get("text")
+            attached_files = msg_get("attached_files")
 
             # Handle deleted messages
-            if msg.get("message_state") == "DELETED":
-                deletion_type = msg.get("deletion_metadata", {}).get("deletion_type", "Unknown reason")
+            if msg_get("message_state") == "DELETED":
+                deletion_type = msg_get("deletion_metadata", {}).get("deletion_type", "Unknown reason")
                 text = f"[Message deleted by {deletion_type}]"
 
             # Handle regular messages with text
-            elif "text" in msg and msg["text"].strip():
-                text = msg["text"]
+            elif text_value and text_value.strip():
+                text = text_value
 
             # Handle attachment messages
-            elif "attached_files" in msg:
-                attachments = msg["attached_files"]
+            elif attached_files is not None:
                 filenames = [
                     file.get("export_name", file.get("original_name", "Unknown File"))
-                    for file in attachments
+                    for file in attached_files
                 ]
                 text = "Attachment: " + ", ".join(filenames)
 
-            # Handle if there is a URL only in the message
-            elif msg.get('annotations', [{}])[0].get('url_metadata', {}).get('image_url', None):
-                text = msg.get('annotations', [{}])[0].get('url_metadata', {}).get('image_url')
-            
-            # Handle if there is a Meeting URL in the message
-            elif msg.get('annotations', [{}])[0].get('video_call_metadata', {}).get('meeting_space', {}).get('meeting_url',None):
-                text = msg.get('annotations', [{}])[0].get('video_call_metadata', {}).get('meeting_space', {}).get('meeting_url')
-
-            # Handle if there is Call Data in the message
-            elif msg.get('annotations', [{}])[0].get('gsuite_integration_metadata', {}).get('call_data', None):
-                call_data = msg.get('annotations', [{}])[0].get('gsuite_integration_metadata', {}).get('call_data', {})
-                text = f"Call Data: {call_data}"
-
-            # Handle if there is a Google Doc in the message
-            elif msg.get('annotations', [{}])[0].get('drive_metadata', None):
-                drive_document = msg.get('annotations', [{}])[0].get('drive_metadata', {})
-                text = f"Drive Document: {drive_document}"
-            
-            # Handle if there are Annotations that I haven't catered for specifically
-            elif 'annotations' in msg:
-                text = f"Annotations: {msg['annotations']}"
-            
-            # Fallback case (shouldn't normally happen)
+            # Annotation-only messages: walk annotations[0] once, binding
+            # each lookup with := instead of re-chaining .get defaults per
+            # branch
             else:
-                text = "[No text]"
+                annotations = msg_get('annotations')
+                annotation = annotations[0] if annotations else {}
+
+                # Handle if there is a URL only in the message
+                if (image_url := annotation.get('url_metadata', {}).get('image_url')):
+                    text = image_url
+
+                # Handle if there is a Meeting URL in the message
+                elif (meeting_url := annotation.get('video_call_metadata', {}).get('meeting_space', {}).get('meeting_url')):
+                    text = meeting_url
+
+                # Handle if there is Call Data in the message
+                elif (call_data := annotation.get('gsuite_integration_metadata', {}).get('call_data')):
+                    text = f"Call Data: {call_data}"
+
+                # Handle if there is a Google Doc in the message
+                elif (drive_document := annotation.get('drive_metadata')):
+                    text = f"Drive Document: {drive_document}"
+
+                # Handle if there are Annotations that I haven't catered for specifically
+                elif annotations is not None:
+                    text = f"Annotations: {annotations}"
+
+                # Fallback case (shouldn't normally happen)
+                else:
+                    text = "[No text]"
+
+            append_part(f"[{timestamp}] {creator}: {text}\n")
 
-            out_file.write(f"[{timestamp}] {creator}: {text}\n")
+            # Flush periodically so buffering doesn't undo the streaming parse
+            if len(parts) >= 10000:
+                out_file.writelines(parts)
+                parts.clear()
 
+        parts.append(f"\nMessages: {message_count}\n")
 
         # List attachments if any
         if attachments:
-            out_file.write("\nAttachments:\n")
-            out_file.write("-" * 40 + "\n")
-            for attachment in attachments:
-                out_file.write(f"- {attachment}\n")
+            parts.append("\nAttachments:\n")
+            parts.append("-" * 40 + "\n")
+            parts.extend(f"- {attachment}\n" for attachment in attachments)
+
+        out_file.writelines(parts)
 
 
 def process_google_chat_folder(chat_root):
@@ -198,15 +406,30 @@ def process_google_chat_folder(chat_root):
         return
     
     output_folder = chat_root  # Store output in the root Google Chat folder
-    chat_list = os.listdir(groups_folder)
-    total_messages = len(chat_list)
 
-    with tqdm(total=total_messages, desc="Processing Chats", unit=" chat") as pbar:
-        for folder in chat_list:
-            pbar.update(1)
-            folder_path = os.path.join(groups_folder, folder)
-            if os.path.isdir(folder_path):  # Process only directories
-                process_chat_folder(folder_path, output_folder)
+    # Create the transcripts directory once rather than per chat folder, and
+    # clear any transcripts left by a previous run: the O_CREAT|O_EXCL dedup
+    # in the workers would otherwise suffix around last run's files instead
+    # of replacing them
+    transcripts_dir = os.path.join(output_folder, "transcripts")
+    os.makedirs(transcripts_dir, exist_ok=True)
+    with os.scandir(transcripts_dir) as it:
+        for entry in it:
+            if entry.name.endswith(".txt") and entry.is_file():
+                os.unlink(entry.path)
+
+    # DirEntry.is_dir() reuses type information from the directory read
+    # itself, so this needs no stat call per entry
+    with os.scandir(groups_folder) as it:
+        folder_paths = [entry.path for entry in it if entry.is_dir()]  # Process only directories
+
+    # Each chat folder is independent (own JSON read, own output file), so
+    # fan the work out across CPU cores; as_completed keeps the progress bar
+    # moving as folders finish rather than in submission order
+    with ProcessPoolExecutor() as executor:
+        futures = [executor.submit(process_chat_folder, path, output_folder) for path in folder_paths]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Processing Chats", unit=" chat"):
+            future.result()  # Surface any worker exception
 
 
 def load_ignore_list(ignore_file):
@@ -214,106 +437,82 @@ def load_ignore_list(ignore_file):
     ignore_list = set()
     if os.path.exists(ignore_file):
         with open(ignore_file, "r", encoding="utf-8") as file:
-            ignore_list = {line.strip() for line in file if line.strip()}
+            # Lowercased once here; call sites compare lowercased addresses
+            ignore_list = {line.strip().lower() for line in file if line.strip()}
     return ignore_list
 
-def clean_style_attributes(style):
-    """Clean unsupported style attributes and convert them to supported ones."""
-    # Define a mapping of unsupported attributes to their supported equivalents (if any)
-    attribute_mapping = {
-        'textTransform': 'textCase',  # Convert 'textTransform' to 'textCase'
-        'textColor': 'textColor',     # 'textColor' is supported
-        'fontWeight': 'bold',         # Convert 'fontWeight' to 'bold'
-        'fontStyle': 'italic',       # Convert 'fontStyle' to 'italic'
-        'textDecoration': 'underline',  # Convert 'textDecoration' to 'underline'
-        'fontFamily': 'fontName',     # Convert 'fontFamily' to 'fontName'
-        'fontSize': 'fontSize',       # 'fontSize' is supported
-        'backgroundColor': 'backColor',  # Convert 'backgroundColor' to 'backColor'
-    }
-    
-    # Define supported attributes
-    supported_attributes = {
-        'fontName', 'fontSize', 'leading', 'textColor', 'alignment', 'backColor',
-        'spaceBefore', 'spaceAfter', 'bold', 'italic', 'underline', 'strike',
-        'firstLineIndent', 'leftIndent', 'rightIndent', 'bulletText', 'bulletFontName',
-        'bulletFontSize', 'textCase', 'listStyle', 'listMarker'
-    }
-
-    # Remove unsupported attributes and convert them if applicable
-    cleaned_style = {}
-    for attr, value in style.items():
-        if attr in supported_attributes:
-            cleaned_style[attr] = value
-        elif attr in attribute_mapping:
-            # Convert unsupported attribute to supported attribute
-            cleaned_style[attribute_mapping[attr]] = value
-
-    return cleaned_style
-
-def parse_style(style_string):
-    """Parse the inline 'style' attribute into a dictionary."""
-    style_dict = {}
-    for rule in style_string.split(';'):
-        if rule.strip():
-            key, value = rule.split(':', 1)
-            style_dict[key.strip()] = value.strip()
-    return style_dict
-
-def format_style(style_dict):
-    """Convert a style dictionary back into a 'style' string."""
-    return '; '.join(f'{key}: {value}' for key, value in style_dict.items())
+# HTML tags that ReportLab's Paragraph understands
+SUPPORTED_HTML_TAGS = frozenset([
+    'b', 'strong',  # Bold text
+    'i', 'em',      # Italic text
+    'u',              # Underlined text
+    'strike',         # Strikethrough text
+    'sub',            # Subscript text
+    'sup',            # Superscript text
+    'font',           # Font face, size, and color (deprecated)
+    'p',              # Paragraph tag
+    'br',             # Line break
+    'ul',             # Unordered list
+    'ol',             # Ordered list
+    'li',             # List item
+    'a',              # Hyperlink
+    'center',         # Center-align text (deprecated)
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6'  # Header tags
+])
+
+# Attributes ReportLab accepts on those tags
+SUPPORTED_TAG_ATTRS = ("href", "name", "target")
+
 
 def clean_html(html):
     """Sanitize HTML for ReportLab's Paragraph while keeping basic formatting."""
-    soup = BeautifulSoup(html, "html.parser")
-
-    # List of supported HTML tags
-    supported_html_tags = [
-        'b', 'strong',  # Bold text
-        'i', 'em',      # Italic text
-        'u',              # Underlined text
-        'strike',         # Strikethrough text
-        'sub',            # Subscript text
-        'sup',            # Superscript text
-        'font',           # Font face, size, and color (deprecated)
-        'p',              # Paragraph tag
-        'br',             # Line break
-        'ul',             # Unordered list
-        'ol',             # Ordered list
-        'li',             # List item
-        'a',              # Hyperlink
-        'center',         # Center-align text (deprecated)
-        'h1', 'h2', 'h3', 'h4', 'h5', 'h6'  # Header tags
-    ]
+    # Fast path: no markup at all, so skip building a parse tree and just
+    # escape ampersands and keep the line breaks
+    if "<" not in html:
+        return html.replace("&", "&amp;").replace("\n", "<br/>")
+
+    if SelectolaxHTMLParser is not None:
+        return _clean_html_selectolax(html)
+
+    soup = BeautifulSoup(html, BS4_PARSER)
 
-    # Iterate through all tags in the HTML
+    # One walk over the tree does everything the previous four passes did:
+    # unwrap unsupported tags (tables/divs/spans included — they're not in
+    # the whitelist), convert <br> for proper line breaks, and strip
+    # attributes ReportLab doesn't support
     for tag in soup.find_all(True):  # True means find all tags
-        if tag.name not in supported_html_tags:
+        if tag.name == "br":
+            tag.replace_with("<br/>")
+        elif tag.name not in SUPPORTED_HTML_TAGS:
             tag.unwrap()  # Remove the tag but keep its contents
         else:
-            # Clean attributes of the supported tags
-            tag.attrs = {key: value for key, value in tag.attrs.items() if key in ["href", "name", "target"]}
+            tag.attrs = {key: value for key, value in tag.attrs.items() if key in SUPPORTED_TAG_ATTRS}
 
-            # If the tag has a 'style' attribute, clean it
-            if 'style' in tag.attrs:
-                style = tag.attrs['style']
-                cleaned_style = clean_style_attributes(parse_style(style))
-                tag.attrs['style'] = format_style(cleaned_style)  # Reassign cleaned style
+    return str(soup)
 
-    # Remove complex structures (tables, divs, spans) but keep content
-    for tag in soup(["table", "tr", "td", "th", "tbody", "tfoot", "thead", "div", "span"]):
-        tag.unwrap()  # Keep content but remove tag
 
-    # Convert <br> to <br/> for proper line breaks
-    for br in soup.find_all("br"):
-        br.replace_with("<br/>")
+def _clean_html_selectolax(html):
+    """clean_html fast path using selectolax's C parser; same tag whitelist."""
+    tree = SelectolaxHTMLParser(html)
 
-    # Strip attributes that ReportLab doesn't support
-    for tag in soup.find_all(True):
-        tag.attrs = {key: value for key, value in tag.attrs.items() if key in ["href", "name", "target"]}
+    for node in tree.css('*'):
+        tag = node.tag
+        if tag in ("html", "head", "body"):
+            continue
+        if tag not in SUPPORTED_HTML_TAGS:
+            node.unwrap()  # Remove the tag but keep its contents
+            continue
+        # Strip attributes that ReportLab doesn't support
+        for attr in [a for a in node.attrs if a not in SUPPORTED_TAG_ATTRS]:
+            del node.attrs[attr]
 
-    return str(soup)
+    body = tree.body
+    if body is None:
+        return html
+    cleaned = "".join(child.html or "" for child in body.iter(include_text=True))
 
+    # Convert <br> to <br/> for proper line breaks
+    return cleaned.replace("<br>", "<br/>")
 
 
 def process_mbox_to_pdf(mbox_path, output_pdf, ignore_list):
@@ -330,92 +529,127 @@ def process_mbox_to_pdf(mbox_path, output_pdf, ignore_list):
         # Otherwise, create the output PDF path in the same folder as the MBOX file
         output_pdf_path = os.path.join(mbox_folder, output_pdf)
 
-    doc = SimpleDocTemplate(output_pdf_path, pagesize=letter)
-    elements = []
-
-    mbox = mailbox.mbox(mbox_path)
-    total_messages = len(mbox)
     threads = defaultdict(list)
-    messages_by_id = {}
-
-    with tqdm(total=total_messages, desc="Processing Emails", unit=" email") as pbar:
-        for message in mbox:
-            msg_id = message["Message-ID"]
-            in_reply_to = message["In-Reply-To"]
-            references = message["References"]
-            sender = message['From']
-            # subject = message['Subject'] if message['Subject'] else "(No Subject)"
-            # date = message['Date'] if message['Date'] else "(No Date)"
 
-            # Parse sender to extract both name and email
-            sender_name, sender_email = email.utils.parseaddr(sender)
+    # Threading only needs a handful of headers, so the first streaming pass
+    # parses headers only and keeps (timestamp, start, end) spans; the full
+    # message is parsed just once, in the render pass, by seeking back to
+    # its span. Nothing message-sized stays resident between passes.
+    header_parser = BytesParser(policy=policy.compat32)
+
+    # Cheap substring prefilter: parseaddr is pure-Python and slow, so only
+    # run it when the raw From header might contain an ignored address
+    ignore_substrings = tuple(ignore_list)
+
+    total_messages = count_mbox_messages(mbox_path)
+    with tqdm(total=total_messages, desc="Processing Emails", unit=" email", miniters=1024, mininterval=0.5) as pbar:
+        for start, end, raw in iter_mbox_messages(mbox_path):
+            headers = header_parser.parsebytes(raw, headersonly=True)
+            msg_id = headers["Message-ID"]
+            in_reply_to = headers["In-Reply-To"]
+            references = headers["References"]
+            sender = (headers['From'] or "").lower()
+
+            if any(addr in sender for addr in ignore_substrings):
+                # Parse sender to confirm it really is an ignored address
+                sender_name, sender_email = email.utils.parseaddr(sender)
+                if sender_email in ignore_list:
+                    pbar.update(1)
+                    continue  # Skip ignored email addresses
 
-            if sender_email in ignore_list:
-                # print(f"Ignoring email from {sender_email} on {date} - Subject: {subject}")
-                pbar.update(1)
-                continue  # Skip ignored email addresses
+            # Precompute a numeric timestamp so the sort compares ints, not
+            # raw RFC 2822 date strings (which also sorted incorrectly)
+            parsed_date = parsedate_tz(headers["Date"]) if headers["Date"] else None
+            date_ts = mktime_tz(parsed_date) if parsed_date else 0
 
             thread_id = in_reply_to or references or msg_id
-            messages_by_id[msg_id] = message
-            threads[thread_id].append(message)
+            threads[thread_id].append((date_ts, start, end))
             pbar.update(1)
 
     total_threads = len(threads)
-    with tqdm(total=total_threads, desc="Organising Threads", unit=" thread") as pbar:
+    with tqdm(total=total_threads, desc="Organising Threads", unit=" thread", miniters=1024, mininterval=0.5) as pbar:
         for thread_id in threads:
-            threads[thread_id].sort(key=lambda msg: msg["Date"] or "")
+            threads[thread_id].sort(key=itemgetter(0))
             pbar.update(1)
 
-    with tqdm(total=total_threads, desc="Rendering PDF", unit=" thread") as pbar:
-        for thread_id, messages in threads.items():
-            for index, msg in enumerate(messages):
-                sender = msg['From']
-                # Parse sender to extract both name and email
-                sender_name, sender_email = email.utils.parseaddr(sender)
-                sender_display = f"{sender_name} ({sender_email})"
-
-                recipient = msg['To']
-                # Split the recipients and parse each one
-                recipients = recipient.split(",") if recipient else []
-                recipient_displays = []
-
-                for recipient in recipients:
-                    recipient_name, recipient_email = email.utils.parseaddr(recipient)
-                    recipient_display = f"{recipient_name} ({recipient_email})" if recipient_name else recipient_email
-                    recipient_displays.append(recipient_display)
-
-                # Join the recipient display names with commas
-                recipient_display = ", ".join(recipient_displays)
-
-                subject = msg['Subject'] if msg['Subject'] else "(No Subject)"
-                date = msg['Date'] if msg['Date'] else "(No Date)"
-                labels = msg['X-Gmail-Labels'] if msg['X-Gmail-Labels'] else "(No Labels)"
-
-                indent = "&nbsp;&nbsp;&nbsp;&nbsp;" * index  # Indent replies
-                email_header = [
-                    Paragraph(f"{indent}From: {sender_display}", styles['Normal']),
-                    Paragraph(f"{indent}To: {recipient_display}", styles['Normal']),
-                    Paragraph(f"{indent}Date: {date}", styles['Normal']),
-                    Paragraph(f"{indent}Subject: {subject}", styles['Normal']),
-                    Paragraph(f"{indent}Labels: {labels}", styles['Normal']),
-                    Spacer(1, 0.2 * inch),
-                ]
-                elements.extend(email_header)
-
-                body = extract_email_body(msg)
-                if body:
-                    body_text = clean_html(body).replace("\n", "<br />")
-                    elements.append(Paragraph(body_text, styles['Normal']))
-                else:
-                    elements.append(Paragraph("(No content)", styles['Italic']))
-                
-                elements.append(Spacer(1, 0.5 * inch))
-                pbar.update(1)
-
     print("Creating PDF File...")
-    doc.build(elements)
+    with open(mbox_path, "rb") as mbox_file:
+        if PdfWriter is not None:
+            # Render each thread into its own in-memory PDF and append it to
+            # the merged document straight away, so only one thread's
+            # flowables are ever alive at a time
+            writer = PdfWriter()
+            with tqdm(total=total_threads, desc="Rendering PDF", unit=" thread") as pbar:
+                for messages in threads.values():
+                    thread_buffer = io.BytesIO()
+                    thread_doc = SimpleDocTemplate(thread_buffer, pagesize=letter)
+                    thread_doc.build(list(render_thread(mbox_file, messages, styles)))
+                    writer.append(thread_buffer)
+                    pbar.update(1)
+            with open(output_pdf_path, "wb") as pdf_file:
+                writer.write(pdf_file)
+        else:
+            # Without pypdf, fall back to one build over lazily generated
+            # flowables
+            def iter_flowables():
+                with tqdm(total=total_threads, desc="Rendering PDF", unit=" thread") as pbar:
+                    for messages in threads.values():
+                        yield from render_thread(mbox_file, messages, styles)
+                        pbar.update(1)
+
+            doc = SimpleDocTemplate(output_pdf_path, pagesize=letter)
+            doc.build(list(iter_flowables()))
     print(f"Processed {mbox_path} into {output_pdf_path}")
 
+
+def render_thread(mbox_file, messages, styles):
+    """Yield the PDF flowables for one thread of (timestamp, start, end) entries."""
+    for index, (_, start, end) in enumerate(messages):
+        msg = read_mbox_message(mbox_file, start, end)
+        sender = msg['From']
+        # Parse sender to extract both name and email
+        sender_name, sender_email = fast_parseaddr(sender)
+        sender_display = f"{sender_name} ({sender_email})"
+
+        # getaddresses splits the header properly (quoted names may contain
+        # commas, which a plain split breaks on) and parses all addresses in
+        # one call
+        recipient_display = ", ".join(
+            f"{name} ({addr})" if name else addr
+            for name, addr in email.utils.getaddresses([msg['To'] or ""])
+        )
+
+        subject = msg['Subject'] if msg['Subject'] else "(No Subject)"
+        date = msg['Date'] if msg['Date'] else "(No Date)"
+        labels = msg['X-Gmail-Labels'] if msg['X-Gmail-Labels'] else "(No Labels)"
+
+        # One Paragraph for the whole header instead of five: ReportLab's
+        # layout cost scales with flowable count, and header fields are
+        # escaped so stray angle brackets can't break the mini-markup
+        indent = "&nbsp;&nbsp;&nbsp;&nbsp;" * index  # Indent replies
+        header_html = (
+            f"{indent}From: {escape(sender_display)}<br/>"
+            f"{indent}To: {escape(recipient_display)}<br/>"
+            f"{indent}Date: {escape(date)}<br/>"
+            f"{indent}Subject: {escape(subject)}<br/>"
+            f"{indent}Labels: {escape(labels)}"
+        )
+        email_flowables = [Paragraph(header_html, styles['Normal']), Spacer(1, 0.2 * inch)]
+
+        # extract_email_body returns (html, text); prefer the HTML part the
+        # same way the split-mode worker does
+        html_body, text_body = extract_email_body(msg)
+        body = html_body or text_body
+        if body:
+            body_text = clean_html(body).replace("\n", "<br />")
+            email_flowables.append(Paragraph(body_text, styles['Normal']))
+        else:
+            email_flowables.append(Paragraph("(No content)", styles['Italic']))
+
+        # Keep each email's header and body together on the page
+        yield KeepTogether(email_flowables)
+        yield Spacer(1, 0.5 * inch)
+
 def process_body_part(part):
     content_type = part.get_content_type()
     body = part.get_payload(decode=True).decode(errors="ignore")
@@ -467,15 +701,14 @@ def extract_email_body(message):
         return process_body_part(message),""  # Handle non-multipart emails
 
 
+# Translation table replacing filename-unsafe characters with underscores;
+# str.translate applies it in one C-level pass over the string
+_SANITIZE_TABLE = str.maketrans({char: "_" for char in '/\\:*?"<>|\n\r\t'})
+
+
 def sanitize_filename(filename):
     """Sanitize the filename by replacing special characters with underscores."""
-    # List of characters to replace
-    unsafe_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|', '\n', '\r', '\t']
-    
-    for char in unsafe_chars:
-        filename = filename.replace(char, "_")
-    
-    return filename
+    return filename.translate(_SANITIZE_TABLE)
 
 def save_attachment(message, output_folder):
     """Extracts and saves attachments from an email."""
@@ -496,6 +729,93 @@ def save_attachment(message, output_folder):
                     attachments.append(filename)
     return attachments
 
+# Stylesheet for the split-mode workers, built once per process
+_worker_styles = None
+
+
+def _get_worker_styles():
+    global _worker_styles
+    if _worker_styles is None:
+        _worker_styles = getSampleStyleSheet()
+    return _worker_styles
+
+
+def _render_email_pdf(index, raw, output_folder, ignore_list):
+    """Render one raw mbox message to its own PDF (runs in a worker process).
+
+    Returns True when a PDF was written, False when the sender was ignored.
+    """
+    message = email.message_from_bytes(raw, policy=policy.default)
+    sender_name, sender_email = parseaddr(message["From"])
+    if sender_email.lower() in ignore_list:
+        return False
+
+    styles = _get_worker_styles()
+    normal_style = styles["Normal"]
+
+    subject = message["Subject"] if message["Subject"] else "No Subject"
+    date = message["Date"] if message["Date"] else "No Date"
+    recipient = message["To"] if message["To"] else "No Recipient"
+
+    parsed_date = parsedate_tz(date)
+    if parsed_date:
+        email_date = datetime.fromtimestamp(mktime_tz(parsed_date)).strftime("%Y%m%d")
+    else:
+        email_date = "NoDate"
+
+    # Generate file-safe subject
+    safe_subject = "_".join(subject.split()).replace("/", "_").replace("\\", "_")
+    max_length = 100  # You can adjust this length as needed
+    safe_subject = safe_subject[:max_length]  # Truncate if necessary
+    pdf_filename = f"{index+1:04d}_{email_date}_{safe_subject}.pdf"
+    pdf_path = os.path.join(output_folder, pdf_filename)
+
+    # Extract email body
+    html_body, text_body = extract_email_body(message)
+
+    # Save attachments
+    email_folder = os.path.join(output_folder, f"email_{index+1:04d}")
+    attachments = save_attachment(message, email_folder)
+
+    # Create PDF; one Paragraph for the whole header (one markup parse, one
+    # flowable) with the fields escaped against stray angle brackets
+    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
+    header_html = (
+        f"From: {escape(sender_name)} ({escape(sender_email)})<br/>"
+        f"To: {escape(recipient)}<br/>"
+        f"Date: {escape(date)}<br/>"
+        f"Subject: {escape(subject)}"
+    )
+    elements = [
+        Paragraph(header_html, normal_style),
+        Spacer(1, 0.2 * inch)
+    ]
+    try:
+        if text_body and len(text_body) > 0:
+            body_paragraph = Paragraph(text_body, normal_style)
+        else:
+            body_paragraph = Paragraph(html_body, normal_style)
+    except Exception as e:
+        print(f"Error: Unable to extract text body from email sender: {sender_email} subject: {subject} on {date}")
+        print("Will use Text Body instead")
+        try:
+            body_paragraph = Paragraph(text_body, normal_style)
+        except Exception as e:
+            print("Error: Unable to extract text body from email, putting in a default message")
+            body_paragraph = Paragraph("Unable to extrack any content, Sorry", normal_style)
+
+    elements.append(body_paragraph)
+    elements.append(Spacer(1, 0.5 * inch))
+
+    if attachments:
+        elements.append(Paragraph("Attachments:", normal_style))
+        for attachment in attachments:
+            elements.append(Paragraph(attachment, styles["Italic"]))
+
+    doc.build(elements)
+    return True
+
+
 def process_mbox_to_pdfs(mbox_path, ignore_list):
     """Processes an MBOX file and creates a separate PDF for each email."""
 
@@ -503,115 +823,78 @@ def process_mbox_to_pdfs(mbox_path, ignore_list):
     output_folder = os.path.join(os.path.dirname(os.path.abspath(mbox_path)),"emails_output")
 
     os.makedirs(output_folder, exist_ok=True)
-    mbox = mailbox.mbox(mbox_path, factory=lambda f: email.message_from_binary_file(f, policy=policy.default))
-    styles = getSampleStyleSheet()
-    total_messages = len(mbox)
+    total_messages = count_mbox_messages(mbox_path)
     ignore_count = 0
     processed_count = 0
-    
-    with tqdm(total=total_messages, desc="Processing Emails", unit=" email") as pbar:
-        for i, message in enumerate(mbox):
-            sender_name, sender_email = parseaddr(message["From"])
-            if sender_email in ignore_list:
-                ignore_count += 1
-                pbar.update(1)
-                continue
-            
-            subject = message["Subject"] if message["Subject"] else "No Subject"
-            date = message["Date"] if message["Date"] else "No Date"
-            recipient = message["To"] if message["To"] else "No Recipient"
-
-            parsed_date = parsedate_tz(date)
-            if parsed_date:
-                email_date = datetime.fromtimestamp(mktime_tz(parsed_date)).strftime("%Y%m%d")
+
+    # Each email -> PDF is fully independent, so render across CPU cores; the
+    # raw message bytes pickle cheaply to the workers. Submission is windowed
+    # so a huge mbox never sits in the executor queue all at once.
+    max_pending = (os.cpu_count() or 2) * 4
+
+    with ProcessPoolExecutor() as executor, \
+            tqdm(total=total_messages, desc="Processing Emails", unit=" email", miniters=64, mininterval=0.5) as pbar:
+        pending = set()
+
+        def account(future):
+            nonlocal processed_count, ignore_count
+            if future.result():
+                processed_count += 1
             else:
-                email_date = "NoDate"
-
-            # Generate file-safe subject
-            safe_subject = "_".join(subject.split()).replace("/", "_").replace("\\", "_")
-            max_length = 100  # You can adjust this length as needed
-            safe_subject = safe_subject[:max_length]  # Truncate if necessary
-            pdf_filename = f"{i+1:04d}_{email_date}_{safe_subject}.pdf"
-            pdf_path = os.path.join(output_folder, pdf_filename)
-            
-            # Extract email body
-            html_body, text_body = extract_email_body(message)
-            
-            # Save attachments
-            email_folder = os.path.join(output_folder, f"email_{i+1:04d}")
-            attachments = save_attachment(message, email_folder)
-            
-            # Create PDF
-            doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-            elements = [
-                Paragraph(f"From: {sender_name} ({sender_email})", styles["Normal"]),
-                Paragraph(f"To: {recipient}", styles["Normal"]),
-                Paragraph(f"Date: {date}", styles["Normal"]),
-                Paragraph(f"Subject: {subject}", styles["Normal"]),
-                Spacer(1, 0.2 * inch)
-                # Paragraph(body if body else "(No content)", styles["Normal"]),
-                
-            ]
-            try:
-                if text_body and len(text_body) > 0:
-                    body_paragraph = Paragraph(text_body, styles["Normal"])
-                else:
-                    body_paragraph = Paragraph(html_body, styles["Normal"])
-            except Exception as e:
-                print(f"Error: Unable to extract text body from email sender: {sender_email} subject: {subject} on {date}")
-                print("Will use Text Body instead")
-                try:
-                    body_paragraph = Paragraph(text_body, styles["Normal"])
-                except Exception as e:
-                    print("Error: Unable to extract text body from email, putting in a default message")
-                    body_paragraph = Paragraph("Unable to extrack any content, Sorry", styles["Normal"])
-            
-            elements.append(body_paragraph)
-            elements.append(Spacer(1, 0.5 * inch))
-
-            if attachments:
-                elements.append(Paragraph("Attachments:", styles["Normal"]))
-                for attachment in attachments:
-                    elements.append(Paragraph(attachment, styles["Italic"]))
-            
-            doc.build(elements)
-            processed_count += 1
+                ignore_count += 1
             pbar.update(1)
+
+        for i, (start, end, raw) in enumerate(iter_mbox_messages(mbox_path)):
+            pending.add(executor.submit(_render_email_pdf, i, raw, output_folder, ignore_list))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    account(future)
+
+        for future in as_completed(pending):
+            account(future)
+
     print(f"Processed {processed_count}/{total_messages} emails into PDFs in {output_folder}. Ignored {ignore_count} emails.")
 
+# Marker line Google Calendar wraps its boilerplate description block in
+_ENCLOSING_MARKER = r"-::~:~::~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~::~:~::-"
+
+# Compiled once instead of per event inside the parse loop
+_ENCLOSING_RE = re.compile(f"{_ENCLOSING_MARKER}.*?{_ENCLOSING_MARKER}", re.DOTALL)
+_MEET_RE = re.compile(r"https://meet\.google\.com/([a-z]+-[a-z]+-[a-z]+)")
+
+
 def parse_ics(ics_file):
     with open(ics_file, "r", encoding="utf-8") as file:
         print("Reading Calendar...")
         calendar = Calendar(file.read())
-    
+
     events = []
-    enclosing_pattern = r"-::~:~::~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~:~::~:~::-"
-    meet_pattern = r"https://meet\.google\.com/([a-z]+-[a-z]+-[a-z]+)"
     total_events = len(calendar.events)
     
     with tqdm(total=total_events, desc="Processing Events", unit=" event") as pbar:
         for event in calendar.events:
             attendees = []
-            if hasattr(event, "attendees") and event.attendees:
-                for attendee in event.attendees:
-                    if hasattr(attendee, "partstat"):
-                        status = attendee.partstat  # Extract participation status
-                        attendees.append(f"{attendee.common_name} ({status})")
+            for attendee in getattr(event, "attendees", None) or ():
+                status = getattr(attendee, "partstat", None)  # Participation status
+                if status:
+                    attendees.append(f"{attendee.common_name} ({status})")
 
             description = event.description if event.description else ""
             meet_code = ""
 
-            meet_match = re.search(meet_pattern, description)
+            meet_match = _MEET_RE.search(description)
             if meet_match:
                 meet_code = meet_match.group(1)
 
             # Remove enclosed content
-            description = re.sub(f"{enclosing_pattern}.*?{enclosing_pattern}", "", description, flags=re.DOTALL).strip()
+            description = _ENCLOSING_RE.sub("", description).strip()
 
+            # strftime goes through C instead of arrow's format-spec parser
             events.append([
                 event.name,
-                event.begin.to('local').format("YYYY-MM-DD HH:mm"),
-                event.end.to('local').format("YYYY-MM-DD HH:mm") if event.end else "",
+                event.begin.to('local').strftime("%Y-%m-%d %H:%M"),
+                event.end.to('local').strftime("%Y-%m-%d %H:%M") if event.end else "",
                 event.location if event.location else "",
                 description,
                 "; ".join(attendees) if attendees else "No attendees recorded",
@@ -622,16 +905,27 @@ def parse_ics(ics_file):
     return events
 
 def write_to_excel(events, output_file):
+    headers = ["Event Name", "Start Time", "End Time", "Location", "Description", "Accepted Attendees", "Meet Code"]
+
+    if xlsxwriter is not None:
+        # Write-only streaming mode: each row goes to disk as it is written
+        wb = xlsxwriter.Workbook(output_file, {"constant_memory": True})
+        ws = wb.add_worksheet("Calendar Events")
+        ws.write_row(0, 0, headers)
+        for row, event in enumerate(events, start=1):
+            ws.write_row(row, 0, event)
+        wb.close()
+        return
+
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "Calendar Events"
-    
-    headers = ["Event Name", "Start Time", "End Time", "Location", "Description", "Accepted Attendees", "Meet Code"]
+
     ws.append(headers)
-    
+
     for event in events:
         ws.append(event)
-    
+
     wb.save(output_file)
 
 